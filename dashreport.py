@@ -166,28 +166,148 @@ active_class_general = "view-button active" if st.session_state.current_view ==
 current_view_display = "🏢 Detailed View" if st.session_state.current_view == 'branch' else "🌐 General View"
 st.markdown(f"<p style='text-align:center; font-weight:bold; margin-top:10px;'>Current View: {current_view_display}</p>", unsafe_allow_html=True)
 
-# === LOAD DATA ===
+# === LOAD & VALIDATE DATA ===
 file_url = "https://raw.githubusercontent.com/kimeustats/salesdashboard/main/data1.xlsx"
+
+REQUIRED_COLUMNS = {
+    'CY': ['date', 'branch', 'category1', 'amount', 'Cluster'],
+    'TARGETS': ['branch', 'month', 'category1', 'amount', 'cluster'],
+    'PY': ['date', 'branch', 'category1', 'amount', 'cluster'],
+}
+
+class DataValidationError(Exception):
+    """Raised when the workbook has blocking issues; carries the diagnostic report."""
+    def __init__(self, report):
+        super().__init__(f"{(report['Severity'] == 'error').sum()} blocking issue(s) found in the workbook")
+        self.report = report
+
+def _issues(df, mask, sheet, column, issue, severity):
+    # Row is the Excel row number (header is row 1)
+    rows = df[mask]
+    return pd.DataFrame({
+        'Sheet': sheet,
+        'Row': rows.index + 2,
+        'Column': column,
+        'Value': rows[column].astype(str) if column in rows else '',
+        'Issue': issue,
+        'Severity': severity,
+    })
+
+def validate_sheets(sheets):
+    """Check schema, dtypes, dimension values, duplicates and target coverage; return one row per issue."""
+    found = []
+    missing_cols = {name: [c for c in cols if c not in sheets[name].columns] for name, cols in REQUIRED_COLUMNS.items()}
+    for name, cols in missing_cols.items():
+        for col in cols:
+            found.append(pd.DataFrame([{'Sheet': name, 'Row': None, 'Column': col, 'Value': '',
+                                        'Issue': 'Required column missing', 'Severity': 'error'}]))
+        if sheets[name].empty:
+            found.append(pd.DataFrame([{'Sheet': name, 'Row': None, 'Column': '', 'Value': '',
+                                        'Issue': 'Sheet has no data rows', 'Severity': 'error'}]))
+    if any(missing_cols.values()):
+        return pd.concat(found, ignore_index=True).astype({'Row': 'Int64'})
+
+    targets = sheets['TARGETS']
+    known_categories = set(targets['category1'].dropna())
+    known_branches = set(targets['branch'].dropna())
+
+    sales = sheets['CY']
+    known_clusters = set(sales['Cluster'].dropna())
+    target_pairs = pd.MultiIndex.from_frame(targets[['branch', 'category1']])
+
+    if 'paints' not in {str(c).lower() for c in known_categories}:
+        found.append(pd.DataFrame([{'Sheet': 'TARGETS', 'Row': None, 'Column': 'category1', 'Value': '',
+                                    'Issue': "No 'Paints' targets - totals cannot be computed", 'Severity': 'error'}]))
+    else:
+        paints_branches = set(targets.loc[targets['category1'].str.lower() == 'paints', 'branch'])
+        for branch in sorted(known_branches - paints_branches):
+            found.append(pd.DataFrame([{'Sheet': 'TARGETS', 'Row': None, 'Column': 'branch', 'Value': branch,
+                                        'Issue': "Branch has no 'Paints' target", 'Severity': 'error'}]))
+
+    for name, df in sheets.items():
+        amount = pd.to_numeric(df['amount'].astype(str).str.replace(',', ''), errors='coerce')
+        found.append(_issues(df, amount.isna() & df['amount'].notna(), name, 'amount', 'Amount is not numeric', 'error'))
+        found.append(_issues(df, df['amount'].isna(), name, 'amount', 'Amount is blank', 'warning'))
+        if 'date' in REQUIRED_COLUMNS[name]:
+            date = pd.to_datetime(df['date'], errors='coerce')
+            found.append(_issues(df, date.isna() & df['date'].notna(), name, 'date', 'Date cannot be parsed', 'error'))
+            # A blank CY date drops the row from every aggregate
+            found.append(_issues(df, df['date'].isna(), name, 'date', 'Date is blank', 'error' if name == 'CY' else 'warning'))
+        if name != 'CY':
+            # Targets and PY are merged on cluster in the general view
+            found.append(_issues(df, df['cluster'].notna() & ~df['cluster'].isin(known_clusters), name, 'cluster',
+                                 'Cluster not in CY', 'error' if name == 'TARGETS' else 'warning'))
+        if name == 'TARGETS':
+            found.append(_issues(df, df.duplicated(['branch', 'category1', 'month'], keep=False), name, 'branch',
+                                 'Duplicate (branch, category, month) target - summed twice', 'error'))
+            continue
+        # A stray CY category drops out of the totals; old PY categories only feed left merges
+        found.append(_issues(df, df['category1'].notna() & ~df['category1'].isin(known_categories),
+                             name, 'category1', 'Category not in TARGETS', 'error' if name == 'CY' else 'warning'))
+        found.append(_issues(df, df['category1'].isna(), name, 'category1', 'Category is blank', 'warning'))
+        found.append(_issues(df, ~df['branch'].isin(known_branches), name, 'branch', 'Branch has no targets', 'warning'))
+        found.append(_issues(df, df.duplicated(['date', 'branch', 'category1'], keep=False) & df['category1'].notna(),
+                             name, 'branch', 'Duplicate (date, branch, category) row', 'warning'))
+
+    # Pairs of targeted branches with no target row fall out of the totals; a missing Paints target breaks them
+    untargeted = (sales['branch'].isin(known_branches) & sales['category1'].notna()
+                  & ~pd.MultiIndex.from_frame(sales[['branch', 'category1']]).isin(target_pairs))
+    paints = sales['category1'].str.lower() == 'paints'
+    found.append(_issues(sales, untargeted & paints, 'CY', 'category1', 'No target for (branch, category)', 'error'))
+    found.append(_issues(sales, untargeted & ~paints, 'CY', 'category1', 'No target for (branch, category)', 'warning'))
+    found.append(_issues(targets, ~targets['branch'].isin(sales['branch']), 'TARGETS', 'branch', 'Branch has no CY sales', 'warning'))
+
+    report = pd.concat(found, ignore_index=True).astype({'Row': 'Int64'})
+    return report.sort_values(['Severity', 'Sheet', 'Row'], ignore_index=True)
+
+@st.cache_data(ttl=600, show_spinner="Loading and validating data...")
+def load_data(url):
+    # Validation errors are raised (and so never cached); only good data is kept
+    sheets = pd.read_excel(url, sheet_name=["CY", "TARGETS", "PY"], engine="openpyxl")
+    sales, targets, prev_year_sales = sheets["CY"], sheets["TARGETS"], sheets["PY"]
+
+    sales.columns = [col if col == 'Cluster' else col.lower() for col in sales.columns]
+    targets.columns = targets.columns.str.lower()
+    prev_year_sales.columns = prev_year_sales.columns.str.lower()
+
+    # Fully blank rows (trailing Excel formatting) carry no data
+    sales, targets, prev_year_sales = [d.dropna(how='all') for d in (sales, targets, prev_year_sales)]
+
+    report = validate_sheets({'CY': sales, 'TARGETS': targets, 'PY': prev_year_sales})
+    if (report['Severity'] == 'error').any():
+        raise DataValidationError(report)
+
+    # === CLEAN DATA ===
+    sales['date'] = pd.to_datetime(sales['date'])
+    prev_year_sales['date'] = pd.to_datetime(prev_year_sales['date'])
+
+    for df in [sales, targets, prev_year_sales]:
+        df['amount'] = df['amount'].astype(str).str.replace(',', '').astype(float)
+
+    return sales, targets, prev_year_sales, report
+
 try:
-    sales = pd.read_excel(file_url, sheet_name="CY", engine="openpyxl")
-    targets = pd.read_excel(file_url, sheet_name="TARGETS", engine="openpyxl")
-    prev_year_sales = pd.read_excel(file_url, sheet_name="PY", engine="openpyxl")
+    sales, targets, prev_year_sales, validation_report = load_data(file_url)
+except DataValidationError as e:
+    st.error(f"⚠️ Data rejected: {e}. Fix the rows below and re-upload data1.xlsx.")
+    st.dataframe(e.report, use_container_width=True, hide_index=True)
+    st.download_button(label="📥 Download Validation Report",
+                       data=e.report.to_csv(index=False).encode(),
+                       file_name="data_validation_report.csv",
+                       mime="text/csv")
+    st.stop()
 except Exception as e:
     st.error(f"⚠️ Failed to load Excel data: {e}")
     st.stop()
 
-
-
-# === CLEAN DATA ===
-sales.columns = [col if col == 'Cluster' else col.lower() for col in sales.columns]
-targets.columns = targets.columns.str.lower()
-prev_year_sales.columns = prev_year_sales.columns.str.lower()
-
-sales['date'] = pd.to_datetime(sales['date'])
-prev_year_sales['date'] = pd.to_datetime(prev_year_sales['date'])
-
-for df in [sales, targets, prev_year_sales]:
-    df['amount'] = df['amount'].astype(str).str.replace(',', '').astype(float)
+if not validation_report.empty:
+    warning_summary = validation_report.groupby(['Sheet', 'Issue'], as_index=False).size().rename(columns={'size': 'Rows'})
+    with st.expander(f"⚠️ Data Warnings ({len(warning_summary)} types, {len(validation_report)} rows)"):
+        st.dataframe(warning_summary, use_container_width=True, hide_index=True)
+        st.download_button(label="📥 Download Warning Details",
+                           data=validation_report.to_csv(index=False).encode(),
+                           file_name="data_validation_warnings.csv",
+                           mime="text/csv")
 
 targets_agg = targets.groupby(['branch', 'category1'], as_index=False)['amount'].sum().rename(columns={'amount': 'monthly_target'})
 
@@ -195,6 +315,174 @@ targets_agg = targets.groupby(['branch', 'category1'], as_index=False)['amount']
 def working_days_excl_sundays(start_date, end_date):
     return len([d for d in pd.date_range(start=start_date, end=end_date) if d.weekday() != 6])
 
+def compute_metrics(df, days_worked, total_working_days):
+    """Add the performance metrics to a frame with monthly_target, mtd_achieved, daily_achieved and pym."""
+    df['daily_tgt'] = np.where(total_working_days>0, df['monthly_target']/total_working_days, 0)
+    df['achieved_vs_daily_tgt'] = np.where(df['daily_tgt']>0, (df['daily_achieved'] - df['daily_tgt']) / df['daily_tgt'], 0)
+    df['mtd_tgt'] = df['daily_tgt'] * days_worked
+    df['mtd_var'] = np.where(df['mtd_tgt']>0, (df['mtd_achieved'] - df['mtd_tgt']) / df['mtd_tgt'], 0)
+    df['cm'] = df['mtd_achieved']
+    df['achieved_vs_monthly_tgt'] = np.where(df['monthly_target']>0, (df['mtd_achieved'] - df['monthly_target']) / df['monthly_target'], 0)
+    df['projected_landing'] = np.where(days_worked>0, (df['mtd_achieved'] / days_worked) * total_working_days, 0)
+    df['cm_vs_pym'] = np.where(df['pym']>0, (df['cm'] - df['pym']) / df['pym'], 0)
+
+    return df.rename(columns={
+        'monthly_target': 'Monthly TGT',
+        'daily_tgt': 'Daily Tgt',
+        'daily_achieved': 'Daily Achieved',
+        'achieved_vs_daily_tgt': 'Achieved vs Daily Tgt',
+        'mtd_tgt': 'MTD TGT',
+        'mtd_achieved': 'MTD Act.',
+        'mtd_var': 'MTD Var',
+        'cm': 'CM',
+        'achieved_vs_monthly_tgt': 'Achieved VS Monthly tgt',
+        'projected_landing': 'Projected landing',
+        'pym': 'PYM',
+        'cm_vs_pym': 'CM VS PYM'
+    })
+
+# Style for % columns
+cell_style_jscode = JsCode("""
+function(params) {
+    if (params.value == null) return {};
+    if (params.value < 0) {
+        return {color: 'black', backgroundColor: '#ffc0cb', fontWeight: 'bold', textAlign: 'center'};
+    } else if (params.value > 0) {
+        return {color: 'black', backgroundColor: '#d0f0c0', textAlign: 'center'};
+    }
+    return {textAlign: 'center'};
+}
+""")
+
+# === EXCEPTION SCANNER ===
+def scan_exceptions(sales, prev_year_sales, targets_agg, end_dt, days_worked, total_working_days, thresholds, min_size=0):
+    """Score every branch x category pair on end_dt and return those breaching any threshold, worst first.
+
+    Pairs whose Monthly TGT and PYM are both below min_size are skipped as immaterial.
+    """
+    keys = ['branch', 'category1']
+    month_start = pd.Timestamp(end_dt.year, end_dt.month, 1)
+    month_sales = sales[(sales['date'] >= month_start) & (sales['date'] <= end_dt)]
+
+    mtd_agg = month_sales.groupby(keys, as_index=False)['amount'].sum().rename(columns={'amount': 'mtd_achieved'})
+    daily_achieved = (
+        month_sales[month_sales['date'] == end_dt]
+        .groupby(keys, as_index=False)['amount']
+        .sum()
+        .rename(columns={'amount': 'daily_achieved'})
+    )
+
+    prev_year_start = pd.Timestamp(end_dt.year - 1, end_dt.month, 1)
+    prev_year_end_dt = pd.Timestamp(end_dt.year - 1, end_dt.month, end_dt.day)
+    pym_agg = (
+        prev_year_sales[(prev_year_sales['date'] >= prev_year_start) & (prev_year_sales['date'] <= prev_year_end_dt)]
+        .groupby(keys, as_index=False)['amount']
+        .sum()
+        .rename(columns={'amount': 'pym'})
+    )
+
+    # Outer merge so branches with a target but no sales yet are scanned too
+    scan = (
+        targets_agg
+        .merge(mtd_agg, on=keys, how='outer')
+        .merge(daily_achieved, on=keys, how='left')
+        .merge(pym_agg, on=keys, how='left')
+    )
+    scan[['monthly_target', 'mtd_achieved', 'daily_achieved', 'pym']] = scan[['monthly_target', 'mtd_achieved', 'daily_achieved', 'pym']].fillna(0)
+    scan = compute_metrics(scan, days_worked, total_working_days)
+    scan = scan[np.maximum(scan['Monthly TGT'], scan['PYM']) >= min_size]
+
+    # Sundays and dates with no CY rows read -100% everywhere; leave the daily metric out rather than flag every pair
+    if end_dt.weekday() == 6 or not (sales['date'] == end_dt).any():
+        scan['Achieved vs Daily Tgt'] = np.nan
+
+    # One boolean matrix for all pairs x metrics; shortfall = how far below each floor (NaN never breaches)
+    metric_cols = list(thresholds.keys())
+    values = scan[metric_cols].to_numpy()
+    floors = np.array([thresholds[col] for col in metric_cols])
+    breached = values < floors
+    scan['Breaches'] = breached.sum(axis=1)
+    scan['Shortfall'] = np.where(breached, floors - values, 0).sum(axis=1)
+    scan['Flags'] = [', '.join(np.array(metric_cols)[row]) for row in breached]
+
+    scan = scan[scan['Breaches'] > 0].sort_values(['Breaches', 'Shortfall'], ascending=[False, False])
+    scan.insert(0, 'Rank', range(1, len(scan) + 1))
+    return scan[['Rank', 'branch', 'category1', 'Breaches', 'Flags'] + metric_cols +
+                ['Monthly TGT', 'MTD Act.', 'Daily Achieved', 'Projected landing', 'PYM', 'Shortfall']]
+
+def render_exception_scanner(sales, prev_year_sales, targets_agg, end_dt, days_worked, total_working_days):
+    # Scans all pairs regardless of the filters (including From), so it is also shown when the filters match nothing
+    st.markdown(f"### <center>🚨 <span style='font-size:22px; font-weight:bold; color:#7b38d8;'>EXCEPTION SCANNER - Month-to-date, 01–{end_dt:%d %b %Y}</span></center>", unsafe_allow_html=True)
+
+    # Thresholds are floors in %: a pair is flagged when a metric falls below its floor
+    with st.expander("⚙️ Scanner Thresholds (%)"):
+        th_col1, th_col2, th_col3, th_col4 = st.columns(4)
+        with th_col1:
+            th_mtd_var = st.number_input("MTD Var below", value=-20.0, step=1.0, key="th_mtd_var")
+        with th_col2:
+            th_daily = st.number_input("Achieved vs Daily Tgt below", value=-50.0, step=1.0, key="th_daily")
+        with th_col3:
+            th_pym = st.number_input("CM VS PYM below", value=-20.0, step=1.0, key="th_pym")
+        with th_col4:
+            th_min_size = st.number_input("Min Monthly TGT / PYM", value=0.0, step=100000.0, key="th_min_size")
+        st.caption("MTD Var also covers projected landing vs monthly target - both are the same ratio, so they share one floor. "
+                   "MTD is always measured from the 1st of the month, not the From date. "
+                   "The daily metric is skipped on Sundays and on dates with no sales rows.")
+
+    scan_thresholds = {
+        'MTD Var': th_mtd_var / 100,
+        'Achieved vs Daily Tgt': th_daily / 100,
+        'CM VS PYM': th_pym / 100
+    }
+    scan_percent_cols = list(scan_thresholds.keys()) + ['Shortfall']
+
+    exceptions = scan_exceptions(sales, prev_year_sales, targets_agg, end_dt, days_worked, total_working_days,
+                                 scan_thresholds, min_size=th_min_size)
+
+    if exceptions.empty:
+        st.success("✅ No branch-category pairs breach the current thresholds.")
+        return
+
+    st.markdown(f"<p style='text-align:center; font-weight:bold;'>{len(exceptions)} branch-category pairs flagged</p>", unsafe_allow_html=True)
+
+    exceptions_display = exceptions.copy()
+    for col in scan_percent_cols:
+        exceptions_display[col] = (exceptions_display[col].astype(float) * 100).round(1)
+    for col in ['Monthly TGT', 'MTD Act.', 'Daily Achieved', 'Projected landing', 'PYM']:
+        exceptions_display[col] = exceptions_display[col].round(1)
+
+    gb_scan = GridOptionsBuilder.from_dataframe(exceptions_display)
+    gb_scan.configure_default_column(filter=True, sortable=True, resizable=True, autoHeight=True)
+    for col in scan_percent_cols:
+        gb_scan.configure_column(
+            col,
+            type=["numericColumn", "numberColumnFilter", "customNumericFormat"],
+            valueFormatter="x == null ? '' : x.toFixed(1) + '%'",
+            headerClass='header-center'
+        )
+    for col in scan_thresholds:
+        gb_scan.configure_column(col, cellStyle=cell_style_jscode)
+    AgGrid(exceptions_display, gridOptions=gb_scan.build(), enable_enterprise_modules=False,
+           allow_unsafe_jscode=True, theme="material", height=400, fit_columns_on_grid_load=False,
+           reload_data=True, key="exception_grid")
+
+    scan_buffer = io.BytesIO()
+    with pd.ExcelWriter(scan_buffer, engine='openpyxl') as writer:
+        exceptions.to_excel(writer, index=False, sheet_name='Exceptions')
+        ws = writer.sheets['Exceptions']
+        header = list(exceptions.columns)
+        for col_name in scan_percent_cols:
+            col_idx = header.index(col_name) + 1
+            for row in range(2, len(exceptions) + 2):
+                ws.cell(row=row, column=col_idx).number_format = '0.0%'
+    scan_buffer.seek(0)
+
+    st.download_button(label="📥 Download Exceptions as Excel",
+                       data=scan_buffer,
+                       file_name=f"sales_exceptions_{end_dt:%Y%m%d}.xlsx",
+                       mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                       key="download_exceptions")
+
 # === FILTERS ===
 clusters = sales["Cluster"].dropna().unique()
 branches = sales["branch"].dropna().unique()
@@ -238,10 +526,6 @@ if selected_category != "All":
     filtered = filtered[filtered["category1"] == selected_category]
 filtered = filtered[(filtered["date"] >= pd.to_datetime(start_date)) & (filtered["date"] <= pd.to_datetime(end_date))]
 
-if filtered.empty:
-    st.warning("⚠️ No sales data found for the selected filters or date range.")
-    st.stop()
-
 # === CORRECT WORKING DAYS LOGIC ===
 end_dt = pd.to_datetime(end_date)
 month_start = pd.Timestamp(end_dt.year, end_dt.month, 1)
@@ -250,6 +534,11 @@ month_end = pd.Timestamp(end_dt.year, end_dt.month, end_dt.days_in_month)
 days_worked = working_days_excl_sundays(month_start, end_dt)
 total_working_days = working_days_excl_sundays(month_start, month_end)
 
+if filtered.empty:
+    st.warning("⚠️ No sales data found for the selected filters or date range.")
+    render_exception_scanner(sales, prev_year_sales, targets_agg, end_dt, days_worked, total_working_days)
+    st.stop()
+
 # === AGGREGATIONS ===
 if st.session_state.current_view == 'general':
 
@@ -391,29 +680,7 @@ else:
 
 
 # === CALCULATIONS ===
-df['daily_tgt'] = np.where(total_working_days>0, df['monthly_target']/total_working_days, 0)
-df['achieved_vs_daily_tgt'] = np.where(df['daily_tgt']>0, (df['daily_achieved'] - df['daily_tgt']) / df['daily_tgt'], 0)
-df['mtd_tgt'] = df['daily_tgt'] * days_worked
-df['mtd_var'] = np.where(df['mtd_tgt']>0, (df['mtd_achieved'] - df['mtd_tgt']) / df['mtd_tgt'], 0)
-df['cm'] = df['mtd_achieved']
-df['achieved_vs_monthly_tgt'] = np.where(df['monthly_target']>0, (df['mtd_achieved'] - df['monthly_target']) / df['monthly_target'], 0)
-df['projected_landing'] = np.where(days_worked>0, (df['mtd_achieved'] / days_worked) * total_working_days, 0)
-df['cm_vs_pym'] = np.where(df['pym']>0, (df['cm'] - df['pym']) / df['pym'], 0)
-
-df.rename(columns={
-    'monthly_target': 'Monthly TGT',
-    'daily_tgt': 'Daily Tgt',
-    'daily_achieved': 'Daily Achieved',
-    'achieved_vs_daily_tgt': 'Achieved vs Daily Tgt',
-    'mtd_tgt': 'MTD TGT',
-    'mtd_achieved': 'MTD Act.',
-    'mtd_var': 'MTD Var',
-    'cm': 'CM',
-    'achieved_vs_monthly_tgt': 'Achieved VS Monthly tgt',
-    'projected_landing': 'Projected landing',
-    'pym': 'PYM',
-    'cm_vs_pym': 'CM VS PYM'
-}, inplace=True)
+df = compute_metrics(df, days_worked, total_working_days)
 
 # === KPI CALCULATIONS ===
 current_view = st.session_state.current_view
@@ -579,19 +846,6 @@ gb = GridOptionsBuilder.from_dataframe(df_display)
 gb.configure_default_column(filter=True, sortable=True, resizable=True, autoHeight=True)
 gb.configure_column("is_totals", hide=True)
 
-# Style for % columns
-cell_style_jscode = JsCode("""
-function(params) {
-    if (params.value == null) return {};
-    if (params.value < 0) {
-        return {color: 'black', backgroundColor: '#ffc0cb', fontWeight: 'bold', textAlign: 'center'};
-    } else if (params.value > 0) {
-        return {color: 'black', backgroundColor: '#d0f0c0', textAlign: 'center'};
-    }
-    return {textAlign: 'center'};
-}
-""")
-
 # Apply formatting for % columns
 for col in percent_cols:
     gb.configure_column(
@@ -673,3 +927,5 @@ st.download_button(label="📥 Download Table as Excel",
                    data=excel_buffer,
                    file_name=filename,
                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet") 
+
+render_exception_scanner(sales, prev_year_sales, targets_agg, end_dt, days_worked, total_working_days)